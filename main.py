@@ -1,3 +1,4 @@
+import argparse
 import logging
 import os
 from pipeline.data_ingestion import DataIngestionPipeline
@@ -5,6 +6,9 @@ from pipeline.regex_processing import RegexProcessingPipeline
 from pipeline.api_processing import APIGeocodingPipeline
 from pipeline.warehouse_mapping import WarehouseMappingPipeline
 from pipeline.data_write import DataWritingPipeline
+from pipeline import schema
+from pipeline.checkpoint import StageJournal
+from pipeline.streaming import Stage, StreamingExecutor
 
 # Configure logging
 logging.basicConfig(
@@ -13,7 +17,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_pipeline():
+def run_ingestion():
     STAGE_NAME = "DATA INGESTION"
     try:
         logger.info(f">>> STAGE {STAGE_NAME} STARTED <<<")
@@ -23,12 +27,17 @@ def run_pipeline():
 
         if not data_changed:
             logger.info("No changes in data. Stopping pipeline execution.")
-            return
+        return data_changed
     except Exception as e:
         logger.error(f">>> STAGE {STAGE_NAME} FAILED <<<")
         logger.exception(e)
         raise e
 
+
+def run_pipeline():
+    if not run_ingestion():
+        return
+
     # If data has changed, continue with the rest of the pipeline
     stages = [
         ("REGEX PROCESSING", RegexProcessingPipeline),
@@ -49,5 +58,84 @@ def run_pipeline():
             raise e
 
 
+def run_streaming_pipeline(
+    batch_size=1000, queue_size=4, geocode_workers=4, write_workers=2
+):
+    """Run the post-ingestion stages concurrently over batches of orders so
+    regex matching, geocoding and DB writes overlap."""
+    if not run_ingestion():
+        return
+
+    regex = RegexProcessingPipeline()
+    geocoder = APIGeocodingPipeline()
+    mapper = WarehouseMappingPipeline()
+    writer = DataWritingPipeline()
+    mapping_df = mapper.load_mapping()
+
+    # Both journals are keyed on the ingestion snapshot and on the files the
+    # stages derive their rows from, so a failed run resumes without paying
+    # again for geocoding calls or DB writes that already landed
+    orders = schema.read_csv(regex.input_file)
+    sources = [regex.zones_file, mapper.mapping_file]
+    geocoder.journal = StageJournal("streaming_api_processing", orders, sources)
+    write_journal = StageJournal("streaming_data_write", orders, sources)
+
+    def write_batch(df):
+        if not writer.update_database(df, write_journal):
+            raise RuntimeError("Data write failed; rerun to resume from the journal")
+        return df
+
+    # Mapping mutates the shared mapping frame, so it keeps a single worker
+    stages = [
+        Stage(
+            "REGEX PROCESSING", regex.process_chunk, output_file=regex.output_file
+        ),
+        Stage(
+            "API PROCESSING",
+            geocoder.process_batch,
+            workers=geocode_workers,
+            output_file=geocoder.output_file,
+        ),
+        Stage(
+            "WAREHOUSE MAPPING",
+            lambda df: mapper.process_data(df, mapping_df),
+            output_file=mapper.output_file,
+        ),
+        Stage("DATA WRITING", write_batch, workers=write_workers),
+    ]
+
+    logger.info(">>> STREAMING STAGES STARTED <<<")
+    batches = (
+        orders.iloc[start : start + batch_size].copy()
+        for start in range(0, len(orders), batch_size)
+    )
+    StreamingExecutor(stages, queue_size=queue_size).run(batches)
+    regex.resolver.save_priors()
+    regex.resolver.save_decisions()
+    geocoder.journal.clear()
+    write_journal.clear()
+    logger.info(">>> STREAMING STAGES COMPLETED <<<")
+
+
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Run the zone mapping pipeline")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="overlap the stages over batches instead of running them one by one",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--geocode-workers", type=int, default=4)
+    parser.add_argument("--write-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.streaming:
+        run_streaming_pipeline(
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+            geocode_workers=args.geocode_workers,
+            write_workers=args.write_workers,
+        )
+    else:
+        run_pipeline()
@@ -0,0 +1,156 @@
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Mobile/landline numbers people paste into the address field
+PHONE_NUMBER = re.compile(r"(?:\+?92|0)?3\d{2}[\s-]?\d{7}|\d{10,}")
+# House, plot, flat, street... numbers: "house no. 12", "h#4-b", "plot 17/2".
+# The short "h"/"st" forms need a "#" or "no" after them, since a bare "h 13"
+# is an Islamabad sector rather than a house number
+UNIT_NUMBER = re.compile(
+    r"(?:\b(?:house|plot|flat|shop|apartment|apt|room|office|floor|street|gali|lane)"
+    r"\s*(?:no|number)?\s*[#:.-]?"
+    r"|\b(?:h|st)\s*(?:#|no\b\.?)"
+    r"|#|\bno\b\.?)"
+    r"\s*\w*\d\w*(?:[-/]\w+)*"
+)
+# Sector ids such as "H-9/1", "g 11" or "F-7", kept as one token ("h9_1")
+SECTOR = re.compile(r"\b([a-z])\s*-?\s*(\d+)(?:/(\d+))?\b")
+SECTOR_TOKEN = re.compile(r"[a-z]\d+(?:_\d+)?")
+STOPWORDS = {
+    "near",
+    "opp",
+    "opposite",
+    "behind",
+    "front",
+    "the",
+    "of",
+    "and",
+    "in",
+    "no",
+    "pakistan",
+}
+
+
+class AddressCoalescer:
+    """Incremental near-duplicate index over addresses, per city.
+
+    Addresses are canonicalised into token sets and indexed with MinHash/LSH.
+    The first address of each cluster is geocoded; later addresses whose token
+    sets are similar enough reuse its result instead of calling the API.
+    """
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.7):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Minimum Jaccard similarity for two addresses to share a result
+        self.threshold = threshold
+        # Addresses with fewer tokens than this besides the city name say too
+        # little about the place to share a result with anything, unless one
+        # of them is a sector id
+        self.min_tokens = 2
+
+        self.prime = np.uint64((1 << 61) - 1)
+        rng = np.random.RandomState(42)
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+        self.lock = threading.Lock()
+        # (city, tokens) -> [lock, waiters] for addresses being geocoded
+        self.in_flight = {}
+        self.exact = {}
+        self.buckets = {}
+        self.leaders = []
+        self.hits = 0
+
+    def canonicalize(self, address):
+        address = str(address).lower()
+        address = PHONE_NUMBER.sub(" ", address)
+        address = UNIT_NUMBER.sub(" ", address)
+        address = SECTOR.sub(
+            lambda m: f"{m.group(1)}{m.group(2)}"
+            + (f"_{m.group(3)}" if m.group(3) else ""),
+            address,
+        )
+        address = re.sub(r"[^a-z0-9_]+", " ", address)
+        return frozenset(
+            token for token in address.split() if token not in STOPWORDS
+        )
+
+    def is_informative(self, city, tokens):
+        tokens = tokens - self.canonicalize(city)
+        if any(SECTOR_TOKEN.fullmatch(token) for token in tokens):
+            return True
+        return len(tokens) >= self.min_tokens
+
+    @contextmanager
+    def claim(self, city, tokens):
+        """Serialise lookup-then-add for one (city, token set), so concurrent
+        workers geocode a repeated address once and the rest reuse it."""
+        key = (city, tokens)
+        with self.lock:
+            entry = self.in_flight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.in_flight[key]
+
+    def signature(self, tokens):
+        hashes = np.array(
+            [zlib.crc32(token.encode()) for token in tokens], dtype=np.uint64
+        )
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % self.prime
+        return permuted.min(axis=1)
+
+    def band_keys(self, city, signature):
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            yield (city, band, rows.tobytes())
+
+    def lookup(self, city, tokens):
+        """Return ``(result, confidence)`` for an already geocoded address
+        like this one, or ``(None, None)``."""
+        if not self.is_informative(city, tokens):
+            return None, None
+
+        with self.lock:
+            exact = self.exact.get((city, tokens))
+            if exact is not None:
+                self.hits += 1
+                return self.leaders[exact][1], "duplicate"
+
+            candidates = set()
+            for key in self.band_keys(city, self.signature(tokens)):
+                candidates.update(self.buckets.get(key, ()))
+
+            best, best_similarity = None, 0.0
+            for leader in candidates:
+                leader_tokens = self.leaders[leader][0]
+                similarity = len(tokens & leader_tokens) / len(tokens | leader_tokens)
+                if similarity > best_similarity:
+                    best, best_similarity = leader, similarity
+
+            if best is not None and best_similarity >= self.threshold:
+                self.hits += 1
+                return self.leaders[best][1], "near_duplicate"
+        return None, None
+
+    def add(self, city, tokens, result):
+        if not self.is_informative(city, tokens):
+            return
+        with self.lock:
+            leader = len(self.leaders)
+            self.leaders.append((tokens, result))
+            self.exact.setdefault((city, tokens), leader)
+            for key in self.band_keys(city, self.signature(tokens)):
+                self.buckets.setdefault(key, []).append(leader)
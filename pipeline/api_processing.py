@@ -1,8 +1,13 @@
 import googlemaps
+import numpy as np
 import pandas as pd
 import time
 import os
+import threading
 from pathlib import Path
+from pipeline import schema
+from pipeline.address_coalescing import AddressCoalescer
+from pipeline.checkpoint import StageJournal
 
 
 class APIGeocodingPipeline:
@@ -12,6 +17,13 @@ class APIGeocodingPipeline:
         self.input_file = Path("artifacts/regex_processing/processed_data_details.csv")
         self.output_file = Path("artifacts/api_processing/api_data_details.csv")
         self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = 100
+        self.journal = None
+        # What the geocoding stage adds to a row; only these are checkpointed
+        self.output_columns = ["L3_L4", "Latitude", "Longitude", "Geocode_Confidence"]
+        self.coalescer = AddressCoalescer()
+        self.api_calls = 0
+        self.api_calls_lock = threading.Lock()
 
     def geocode_address(self, address):
         try:
@@ -35,30 +47,115 @@ class APIGeocodingPipeline:
             print(f"Error geocoding {address}: {e}")
             return None, None, None
 
+    def geocode_coalesced(self, address, city):
+        """Geocode ``address`` unless a near-identical address in the same
+        city was already geocoded this run. Returns lat, lng, sublocality and
+        how the result was obtained."""
+        city = str(city)
+        tokens = self.coalescer.canonicalize(address)
+        # Streaming workers geocoding the same address wait for the first one
+        with self.coalescer.claim(city, tokens):
+            result, confidence = self.coalescer.lookup(city, tokens)
+            if result is not None:
+                return result + (confidence,)
+
+            with self.api_calls_lock:
+                self.api_calls += 1
+            result = self.geocode_address(address)
+            # Only share real answers; a failed call should be retried, not copied
+            if result[0] is not None:
+                self.coalescer.add(city, tokens, result)
+        return result + ("geocoded",)
+
+    def output_records(self, df):
+        """The geocoding outputs of ``df`` as JSON-ready dicts, one per row."""
+        outputs = df[["id"] + self.output_columns].astype(object)
+        outputs = outputs.where(outputs.notna(), None)
+        records = outputs.to_dict("records")
+        for record in records:
+            record["id"] = int(record["id"])
+        return records
+
+    def checkpointed_outputs(self, ids):
+        outputs = self.journal.outputs
+        return pd.DataFrame(
+            [outputs[row_id] for row_id in ids if row_id in outputs],
+            columns=["id"] + self.output_columns,
+        )
+
+    def process_batch(self, df):
+        """``process_chunk`` for a journaled run: rows an earlier run already
+        geocoded take their checkpointed outputs, the rest are geocoded and
+        journaled together with their outputs."""
+        # Ids journaled without outputs are geocoded again rather than being
+        # merged as empty results
+        pending = df[~df["id"].isin(self.journal.outputs.keys())]
+        if not pending.empty:
+            batch = self.process_chunk(pending.copy())
+            self.journal.mark_batch(batch["id"], rows=self.output_records(batch))
+        return self.merge_outputs(df, self.checkpointed_outputs(df["id"]))
+
     def process_data(self):
-        df = pd.read_csv(self.input_file)
-        
+        df = schema.read_csv(self.input_file)
+
+        self.journal = StageJournal("api_processing", df)
+        done = df["id"].isin(self.journal.outputs.keys()).sum()
+        print(f"{done} rows already geocoded, {len(df) - done} to go")
+
+        # Each finished batch is journaled with its outputs in one fsynced
+        # append, so a restart never pays for the same geocoding call twice
+        batches = [
+            self.process_batch(df.iloc[start : start + self.batch_size].copy())
+            for start in range(0, len(df), self.batch_size)
+        ]
+        if not batches:
+            return self.process_chunk(df)
+        return schema.apply_schema(pd.concat(batches))
+
+    def merge_outputs(self, df, results):
+        """Join checkpointed geocoding outputs onto the current input rows."""
+        outputs = results.set_index("id")[self.output_columns].astype(object)
+        merged = df.copy()
+        merged['L3_L4'] = merged['L3_L4'].astype(object)
+        for column in ["Latitude", "Longitude", "Geocode_Confidence"]:
+            merged[column] = merged["id"].map(outputs[column])
+
+        # Only rows the regex stage left unmatched take a geocoded sublocality
+        unmatched = merged['L3_L4'].isna() | (merged['L3_L4'] == '')
+        geocoded = merged["id"].map(outputs["L3_L4"])
+        merged.loc[unmatched & geocoded.notna(), 'L3_L4'] = geocoded
+        merged['Latitude'] = merged['Latitude'].astype(float)
+        merged['Longitude'] = merged['Longitude'].astype(float)
+        return schema.apply_schema(merged)
+
+    def process_chunk(self, df):
         # Add new columns for latitude and longitude
-        df['Latitude'] = None
-        df['Longitude'] = None
+        df['Latitude'] = np.nan
+        df['Longitude'] = np.nan
+        df['Geocode_Confidence'] = None
+        # Sublocalities are new values, so edit L3_L4 as plain strings
+        df['L3_L4'] = df['L3_L4'].astype(object)
         
         for index, row in df.iterrows():
             address = row['delivery_address']
             
             if pd.isna(row['L3_L4']) or row['L3_L4'] == '':
-                lat, lng, sublocality = self.geocode_address(address)
+                lat, lng, sublocality, confidence = self.geocode_coalesced(
+                    address, row['dest_city_name']
+                )
                 
                 if sublocality:
                     df.at[index, 'L3_L4'] = sublocality
                 
                 df.at[index, 'Latitude'] = lat
                 df.at[index, 'Longitude'] = lng
+                df.at[index, 'Geocode_Confidence'] = confidence
             
             # Print progress
             if index % 100 == 0:
                 print(f"Processed {index} rows")
         
-        return df
+        return schema.apply_schema(df)
 
     def save_data(self, df):
         df.to_csv(self.output_file, index=False)
@@ -68,6 +165,11 @@ class APIGeocodingPipeline:
         print("Starting geocoding process...")
         df = self.process_data()
         self.save_data(df)
+        print(
+            f"{self.api_calls} API calls made, "
+            f"{self.coalescer.hits} rows reused a near-duplicate's result"
+        )
+        self.journal.clear()
         print("Geocoding Completed.")
 
 
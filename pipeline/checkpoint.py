@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+
+class StageJournal:
+    """Durable record of the rows a stage has finished, so a failed run can
+    resume where it stopped instead of starting over.
+
+    The journal is an append-only JSON-lines file: a header with a hash of the
+    stage input, then one record per finished batch. A record can carry the
+    batch's output rows, which then become durable in the same fsync as the
+    ids. When the input content, or any of the ``sources`` files it is
+    derived with, changes any previous progress is discarded.
+    """
+
+    def __init__(self, stage, data, sources=()):
+        self.path = Path("artifacts/checkpoints") / f"{stage}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.signature = self.input_signature(data, sources)
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        self.logger = logging.getLogger(__name__)
+
+        # Streaming workers mark batches concurrently
+        self.lock = threading.Lock()
+        self.completed_ids = set()
+        # Output rows by id, for records that carry them
+        self.outputs = {}
+        self.batches = 0
+        self.resumed = self.load()
+        if not self.resumed:
+            self.rewrite([])
+
+    def input_signature(self, data, sources=()):
+        digest = hashlib.md5(pd.util.hash_pandas_object(data, index=False).values)
+        for path in sources:
+            digest.update(Path(path).read_bytes())
+        return digest.hexdigest()
+
+    def load(self):
+        if not self.path.exists():
+            return False
+
+        records = []
+        truncated = False
+        with open(self.path, "r") as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A crash mid-append leaves a partial last line; drop it
+                truncated = True
+                break
+
+        if not records or records[0].get("signature") != self.signature:
+            self.logger.info(f"Input changed since {self.path}; starting over")
+            return False
+
+        batches = records[1:]
+        if truncated:
+            self.rewrite(batches)
+        for record in batches:
+            self.completed_ids.update(record["ids"])
+            for row in record.get("rows", []):
+                self.outputs[row["id"]] = row
+        self.batches = len(batches)
+        self.logger.info(
+            f"Resuming from {self.path}: {len(self.completed_ids)} rows in "
+            f"{self.batches} batches already done"
+        )
+        return True
+
+    def rewrite(self, batches):
+        # Write to a temp file in the same directory and rename over the
+        # journal, so a crash never leaves a half-written header behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for record in [{"signature": self.signature}] + batches:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def mark_batch(self, ids, rows=None):
+        """Durably record ``ids`` as done, with their output ``rows`` (dicts
+        holding an ``"id"`` key) when given."""
+        ids = [int(row_id) for row_id in ids]
+        with self.lock:
+            record = {"batch": self.batches, "ids": ids}
+            if rows is not None:
+                record["rows"] = rows
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed_ids.update(ids)
+            for row in rows or []:
+                self.outputs[row["id"]] = row
+            self.batches += 1
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+        self.logger.info(f"Checkpoint {self.path} cleared")
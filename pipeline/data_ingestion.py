@@ -3,6 +3,7 @@ import pandas as pd
 import logging
 from pathlib import Path
 import hashlib
+from pipeline import schema
 
 
 class DataIngestionPipeline:
@@ -80,7 +81,7 @@ class DataIngestionPipeline:
 
         results = self.run_query(query)
         if results:
-            df = pd.DataFrame(results)
+            df = schema.apply_schema(pd.DataFrame(results))
             self.logger.info("Query executed successfully.")
             return df
         else:
@@ -101,7 +102,7 @@ class DataIngestionPipeline:
 
         # Check if the file exists
         if self.output_file.exists():
-            existing_data = pd.read_csv(self.output_file)
+            existing_data = schema.read_csv(self.output_file)
             existing_hash = self.get_data_hash(existing_data)
 
             # Fetch new data
@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
 import mysql.connector
 import logging
 from tqdm import tqdm
+from pipeline import schema
+from pipeline.checkpoint import StageJournal
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -19,10 +22,19 @@ class DataWritingPipeline:
         }
         self.input_file = "artifacts/warehouse_mapping/mapped_data_details.csv"
         self.batch_size = 100
+        # Ingested DB columns, in the order update_row writes them
+        self.target_columns = [
+            "area_id",
+            "area_title",
+            "sort_addr_id",
+            "sort_addr_title",
+            "warehouse_id",
+            "warehouse_title",
+        ]
 
     def load_data(self):
         try:
-            df = pd.read_csv(self.input_file)
+            df = schema.read_csv(self.input_file)
             logger.info(f"Loaded {len(df)} rows from CSV file")
             return df
         except Exception as e:
@@ -38,6 +50,45 @@ class DataWritingPipeline:
             logger.error(f"Error connecting to the database: {err}")
             return None
 
+    def db_value(self, value):
+        # Normalise CSV values (NaN, float ids, numpy scalars, padded titles)
+        # into what the connector sends and what the DB stores
+        if pd.isna(value):
+            return None
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            return value.strip()
+        return value
+
+    def target_values(self, row):
+        l3_id = self.db_value(row["mapped_l3_id"])
+        l3_l4 = self.db_value(row["L3_L4"])
+        return (
+            l3_id,
+            l3_l4,
+            l3_id,
+            l3_l4,
+            self.db_value(row["mapped_warehouse_id"]),
+            self.db_value(row["Mapped_Warehouse_Title"]),
+        )
+
+    def current_values(self, row):
+        return tuple(self.db_value(row[column]) for column in self.target_columns)
+
+    def split_unchanged(self, df):
+        """Return the rows whose mapping differs from what ingestion read from
+        the DB, and the ids of the rows that would be rewritten unchanged."""
+        if not set(self.target_columns).issubset(df.columns):
+            return df, []
+
+        unchanged = df.apply(
+            lambda row: self.target_values(row) == self.current_values(row), axis=1
+        ).astype(bool)
+        return df[~unchanged], [self.db_value(i) for i in df.loc[unchanged, "id"]]
+
     def update_row(self, cursor, row):
         update_query = """
         UPDATE STAGING_db_orders.OrderDetails
@@ -58,62 +109,94 @@ class DataWritingPipeline:
         WHERE id = %s
         """
 
-        data = (
-            row["mapped_l3_id"] if pd.notna(row["mapped_l3_id"]) else None,
-            row["L3_L4"] if pd.notna(row["L3_L4"]) else None,
-            row["mapped_l3_id"] if pd.notna(row["mapped_l3_id"]) else None,
-            row["L3_L4"] if pd.notna(row["L3_L4"]) else None,
-            (
-                row["mapped_warehouse_id"]
-                if pd.notna(row["mapped_warehouse_id"])
-                else None
-            ),
-            (
-                row["Mapped_Warehouse_Title"].strip()
-                if pd.notna(row["Mapped_Warehouse_Title"])
-                else None
-            ),
-            row["id"],
-        )
+        data = self.target_values(row) + (self.db_value(row["id"]),)
 
         cursor.execute(update_query, data)
 
-    def update_database(self, df):
+    def mark_sorted(self, connection, cursor, ids, journal=None):
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start : start + self.batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            try:
+                cursor.execute(
+                    "UPDATE STAGING_db_orders.OrderDetails SET sorted_flag = 1 "
+                    f"WHERE id IN ({placeholders})",
+                    tuple(batch),
+                )
+                connection.commit()
+                if journal is not None:
+                    journal.mark_batch(batch)
+            except mysql.connector.Error as err:
+                logger.error(f"Error flagging unchanged rows: {err}")
+                connection.rollback()
+        logger.info(f"Flagged {len(ids)} unchanged rows as sorted")
+
+    def update_database(self, df, journal=None):
+        """Write the mapped rows, skipping ids ``journal`` already has as
+        committed. Returns True when every row was attempted."""
         connection = self.connect_to_db()
         if not connection:
-            return
+            return False
 
         cursor = connection.cursor()
         total_updated = 0
+        # Ids written since the last commit, journaled once the commit lands
+        uncommitted = []
+        completed = False
 
         try:
+            if journal is not None and journal.completed_ids:
+                committed = df["id"].isin(journal.completed_ids)
+                df = df[~committed]
+                if committed.any():
+                    logger.info(
+                        f"Skipping {int(committed.sum())} rows committed by a "
+                        "previous run"
+                    )
+
+            df, unchanged_ids = self.split_unchanged(df)
+            if unchanged_ids:
+                self.mark_sorted(connection, cursor, unchanged_ids, journal)
+
             for _, row in tqdm(df.iterrows(), total=len(df), desc="Updating rows"):
                 try:
                     self.update_row(cursor, row)
                     total_updated += 1
+                    uncommitted.append(row["id"])
 
                     if total_updated % self.batch_size == 0:
                         connection.commit()
+                        if journal is not None:
+                            journal.mark_batch(uncommitted)
+                        uncommitted = []
                         logger.info(f"Committed {total_updated} rows")
                 except mysql.connector.Error as err:
                     logger.error(f"Error updating row {row['id']}: {err}")
                     connection.rollback()
+                    # The rollback discards the whole open transaction
+                    uncommitted = []
 
             connection.commit()  # Commit any remaining changes
+            if journal is not None and uncommitted:
+                journal.mark_batch(uncommitted)
             logger.info(f"Updated {total_updated} rows in the database.")
+            completed = True
         except Exception as e:
             logger.error(f"Error in update_database: {e}")
         finally:
             cursor.close()
             connection.close()
             logger.info("Database connection closed.")
+        return completed
 
     def main(self):
         logger.info("Starting warehouse mapping data write process...")
         df = self.load_data()
 
         if df is not None:
-            self.update_database(df)
+            journal = StageJournal("data_write", df)
+            if self.update_database(df, journal):
+                journal.clear()
             logger.info("Warehouse mapping data write completed.")
         else:
             logger.error(
@@ -0,0 +1,192 @@
+import re
+import time
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from pipeline import schema
+from pipeline.regex_processing import RegexProcessingPipeline
+
+
+REGEX_METACHARACTERS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+class PatternAnalysisPipeline:
+    """Profiles the city_hierarchy.json patterns against real addresses.
+
+    Writes three reports to artifacts/pattern_analysis:
+      - area_report.csv: per-area search time and match counts
+      - locality_report.csv: per-locality timing and problem flags
+      - city_cost.csv: estimated matching cost per city
+    """
+
+    def __init__(self, sample_per_city=200, slow_threshold=0.005):
+        self.corpus_file = Path("artifacts/data_ingestion/order_details.csv")
+        self.output_dir = Path("artifacts/pattern_analysis")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.sample_per_city = sample_per_city
+        # Seconds for a single search above which a pattern is flagged as slow
+        self.slow_threshold = slow_threshold
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        self.logger = logging.getLogger(__name__)
+
+        self.regex = RegexProcessingPipeline()
+
+    def load_corpus(self):
+        df = schema.read_csv(
+            self.corpus_file, usecols=["delivery_address", "dest_city_name"]
+        ).dropna()
+        counts = df["dest_city_name"].value_counts()
+        sample = (
+            df.groupby("dest_city_name", observed=True)
+            .head(self.sample_per_city)
+            .assign(
+                delivery_address=lambda d: d["delivery_address"].apply(
+                    self.regex.preprocess_address
+                )
+            )
+        )
+        corpus = {
+            str(city): group["delivery_address"].tolist()
+            for city, group in sample.groupby("dest_city_name", observed=True)
+        }
+        return corpus, counts
+
+    def time_pattern(self, pattern, addresses):
+        timings = []
+        hits = 0
+        for address in addresses:
+            started = time.perf_counter()
+            if pattern.search(address):
+                hits += 1
+            timings.append(time.perf_counter() - started)
+        if not timings:
+            return 0.0, 0.0, 0
+        return sum(timings) / len(timings), max(timings), hits
+
+    def profile_areas(self, corpus):
+        rows = []
+        for key, pattern in self.regex.patterns.items():
+            city = key.split(" - ", 1)[0]
+            mean_time, max_time, hits = self.time_pattern(
+                pattern, corpus.get(city, [])
+            )
+            rows.append(
+                {
+                    "city": city,
+                    "area": key.split(" - ", 1)[1],
+                    "alternatives": pattern.pattern.count("|") + 1,
+                    "mean_seconds": mean_time,
+                    "max_seconds": max_time,
+                    "hits": hits,
+                    "slow": max_time > self.slow_threshold,
+                }
+            )
+        return pd.DataFrame(rows)
+
+    def find_redundant(self, localities):
+        """Return the localities already covered by another alternative of the
+        same area: exact duplicates, and plain names containing a shorter plain
+        name (which matches wherever they do, since they are not anchored)."""
+        plain = [loc for loc in localities if not REGEX_METACHARACTERS.search(loc)]
+        redundant = {}
+        seen = set()
+        for locality in localities:
+            lowered = locality.lower()
+            if lowered in seen:
+                redundant[locality] = "duplicate"
+            seen.add(lowered)
+        for longer in plain:
+            for shorter in plain:
+                if len(shorter) < len(longer) and shorter.lower() in longer.lower():
+                    redundant.setdefault(longer, f"covered by '{shorter}'")
+                    break
+        return redundant
+
+    def profile_localities(self, corpus):
+        rows = []
+        for city, areas in self.regex.city_hierarchy.items():
+            addresses = corpus.get(city, [])
+
+            # Names listed under more than one area of a city make every
+            # matching address ambiguous
+            owners = {}
+            for area, localities in areas.items():
+                for locality in localities:
+                    owners.setdefault(locality.lower(), set()).add(area)
+
+            for area, localities in areas.items():
+                redundant = self.find_redundant(localities)
+                for locality in localities:
+                    pattern = re.compile(
+                        "(?i)" + self.regex.locality_pattern(locality)
+                    )
+                    mean_time, max_time, hits = self.time_pattern(pattern, addresses)
+                    overlaps = sorted(owners[locality.lower()] - {area})
+                    rows.append(
+                        {
+                            "city": city,
+                            "area": area,
+                            "locality": locality,
+                            "mean_seconds": mean_time,
+                            "max_seconds": max_time,
+                            "hits": hits,
+                            "pathological": self.regex.is_pathological(locality)
+                            or max_time > self.slow_threshold,
+                            "redundant": redundant.get(locality, ""),
+                            "overlapping_areas": ", ".join(overlaps),
+                        }
+                    )
+        return pd.DataFrame(rows)
+
+    def estimate_city_cost(self, area_report, counts):
+        cost = (
+            area_report.groupby("city")["mean_seconds"]
+            .sum()
+            .rename("seconds_per_address")
+            .to_frame()
+        )
+        cost["orders"] = (
+            counts.rename(index=str).reindex(cost.index).fillna(0).astype(int)
+        )
+        cost["estimated_seconds"] = cost["seconds_per_address"] * cost["orders"]
+        return cost.sort_values("estimated_seconds", ascending=False).reset_index()
+
+    def main(self):
+        self.logger.info("Starting pattern analysis")
+        corpus, counts = self.load_corpus()
+
+        area_report = self.profile_areas(corpus)
+        locality_report = self.profile_localities(corpus)
+        city_cost = self.estimate_city_cost(area_report, counts)
+
+        area_report.to_csv(self.output_dir / "area_report.csv", index=False)
+        locality_report.to_csv(self.output_dir / "locality_report.csv", index=False)
+        city_cost.to_csv(self.output_dir / "city_cost.csv", index=False)
+
+        self.logger.info(
+            f"{int(area_report['slow'].sum())} slow areas, "
+            f"{int(locality_report['pathological'].sum())} pathological, "
+            f"{int((locality_report['redundant'] != '').sum())} redundant and "
+            f"{int((locality_report['overlapping_areas'] != '').sum())} overlapping "
+            f"localities; reports saved to {self.output_dir}"
+        )
+        if not city_cost.empty:
+            top = city_cost.iloc[0]
+            self.logger.info(
+                f"Most expensive city: {top['city']} "
+                f"(~{top['estimated_seconds']:.1f}s for {top['orders']} orders)"
+            )
+
+
+if __name__ == "__main__":
+    try:
+        PatternAnalysisPipeline().main()
+    except Exception as e:
+        logging.error("An error occurred during pattern analysis")
+        logging.exception(e)
+        raise e
@@ -3,7 +3,57 @@ import json
 import pandas as pd
 from pathlib import Path
 import logging
-from functools import lru_cache
+import time
+from pipeline import schema
+from pipeline.resolution_table import ResolutionTable
+from pipeline.zone_resolution import ZoneResolver
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+# Two unbounded wildcards in a row, e.g. ".*foo.*"
+WILDCARD_PAIR = re.compile(r"\.[*+].*\.[*+]")
+REPEAT_OPS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    REPEAT_OPS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def subpatterns(op, av):
+    """Yield the child sequences of one node of a parsed regex."""
+    if op in REPEAT_OPS:
+        yield av[2]
+    elif op == sre_constants.SUBPATTERN:
+        yield av[3]
+    elif op == sre_constants.BRANCH:
+        yield from av[1]
+    elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        yield av[1]
+    elif op == sre_constants.GROUPREF_EXISTS:
+        yield av[1]
+        if av[2] is not None:
+            yield av[2]
+    elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+        yield av
+
+
+def has_nested_repeat(nodes, in_repeat=False):
+    """True when a repeat can match more than once inside another repeat, or
+    an alternation sits inside one, e.g. (a+)+, ((\w+)\s?)+ or (a|aa)+. Both
+    give the engine exponentially many ways to split the same input."""
+    for op, av in nodes:
+        if in_repeat and op == sre_constants.BRANCH:
+            return True
+        repeats = op in REPEAT_OPS and av[1] > 1
+        if in_repeat and repeats:
+            return True
+        for child in subpatterns(op, av):
+            if has_nested_repeat(child, in_repeat or repeats):
+                return True
+    return False
 
 
 class RegexProcessingPipeline:
@@ -19,8 +69,22 @@ class RegexProcessingPipeline:
 
         self.output_file.parent.mkdir(parents=True, exist_ok=True)
 
+        # CPU seconds of matching allowed per address; past it the remaining
+        # areas are skipped and the matches found so far are kept. It is only
+        # checked between areas, so single runaway searches are kept out by
+        # is_pathological at compile time
+        self.match_time_budget = 0.05
+        # Complete match results per (address, city); budget timeouts are not
+        # cached so a later retry can finish the search
+        self.match_cache = {}
+        self.match_cache_size = 10000
+
         self.city_hierarchy = self.load_zones()
         self.patterns = self.compile_patterns(self.city_hierarchy)
+        self.literal_terms = self.collect_literal_terms(self.city_hierarchy)
+        self.resolver = ZoneResolver()
+        self.resolution_table = ResolutionTable()
+        self.resolution_table.load(self.city_hierarchy, self.zones_file)
 
     def load_zones(self):
         try:
@@ -30,21 +94,40 @@ class RegexProcessingPipeline:
             self.logger.error(f"Failed to load zones file: {e}")
             raise
 
+    def is_pathological(self, locality):
+        if WILDCARD_PAIR.search(locality):
+            return True
+        try:
+            return has_nested_repeat(sre_parse.parse(locality))
+        except re.error:
+            # Not a valid regex; it is matched as a literal anyway
+            return False
+
+    def locality_pattern(self, locality):
+        if self.is_pathological(locality):
+            # Guard against catastrophic backtracking from a bad hierarchy edit
+            self.logger.warning(
+                f"Locality '{locality}' looks prone to catastrophic backtracking; "
+                "matching it as a literal string"
+            )
+            return rf"\b{re.escape(locality)}\b"
+        try:
+            # Try to compile the pattern as-is
+            re.compile(locality)
+            # If it compiles, use it directly
+            return f"(?:{locality})"
+        except re.error:
+            # If it doesn't compile, treat it as a literal string
+            return rf"\b{re.escape(locality)}\b"
+
     def compile_patterns(self, city_hierarchy):
         patterns = {}
         for city, areas in city_hierarchy.items():
             for area, localities in areas.items():
-                pattern_parts = []
-                for locality in localities:
-                    try:
-                        # Try to compile the pattern as-is
-                        re.compile(locality)
-                        # If it compiles, use it directly
-                        pattern_parts.append(f"(?:{locality})")
-                    except re.error:
-                        # If it doesn't compile, treat it as a literal string
-                        pattern_parts.append(rf"\b{re.escape(locality)}\b")
-                
+                pattern_parts = [
+                    self.locality_pattern(locality) for locality in localities
+                ]
+
                 pattern = re.compile(
                     r"(?i)"  # Case-insensitive
                     + r"(?:"  # Start non-capturing group
@@ -54,27 +137,67 @@ class RegexProcessingPipeline:
                 patterns[f"{city} - {area}"] = pattern
         return patterns
 
-    @lru_cache(maxsize=10000)
+    def collect_literal_terms(self, city_hierarchy):
+        # Lowercased locality names per area, used to tell whether a match came
+        # from a plain name or from one of the hand-written regex localities
+        literal_terms = {}
+        for city, areas in city_hierarchy.items():
+            for area, localities in areas.items():
+                literal_terms[f"{city} - {area}"] = {
+                    locality.lower() for locality in localities
+                }
+        return literal_terms
+
     def extract_zones(self, address, city):
+        return {
+            area: match["term"]
+            for area, match in self.extract_zone_matches(address, city).items()
+        }
+
+    def extract_zone_matches(self, address, city):
         if pd.isna(address) or pd.isna(city):
             return {}
 
+        key = (address, city)
+        if key in self.match_cache:
+            return self.match_cache[key]
+
+        matched_areas, complete = self.match_zones(address, city)
+        if complete and len(self.match_cache) < self.match_cache_size:
+            self.match_cache[key] = matched_areas
+        return matched_areas
+
+    def match_zones(self, address, city):
         address = self.preprocess_address(address)
         matched_areas = {}
+        # Per-thread CPU time, so waiting on the GIL behind the other streaming
+        # stages does not count against the budget
+        started = time.thread_time()
 
         for area, pattern in self.patterns.items():
             if area.startswith(f"{city} - "):
+                if time.thread_time() - started > self.match_time_budget:
+                    self.logger.warning(
+                        f"Matching exceeded {self.match_time_budget}s for address "
+                        f"'{address}' in {city} (stopped at area {area}); keeping "
+                        f"the {len(matched_areas)} matches found so far"
+                    )
+                    return matched_areas, False
                 match = pattern.search(address)
                 if match:
                     matched_term = match.group()
-                    matched_areas[area] = matched_term
+                    matched_areas[area] = {
+                        "term": matched_term,
+                        "start": match.start(),
+                        "regex": matched_term not in self.literal_terms[area],
+                    }
                     self.logger.debug(
                         f"Match found for {area}: '{matched_term}' in address: '{address}'"
                     )
                 else:
                     self.logger.debug(f"No match for {area} in address: '{address}'")
 
-        return matched_areas
+        return matched_areas, True
 
     def preprocess_address(self, address):
         # Convert to lowercase but keep hyphens and slashes
@@ -83,6 +206,22 @@ class RegexProcessingPipeline:
         address = re.sub(r"\s+", " ", address)
         return address
 
+    def resolve_zone(self, row):
+        # Returns the full "City - Area" hierarchy key, or "" when unresolved
+        matches = row["Matched Zones"]
+        if len(matches) == 1:
+            return next(iter(matches))
+        if len(matches) > 1:
+            area = self.resolver.resolve(
+                row.get("id"),
+                row["delivery_address"],
+                row["dest_city_name"],
+                matches,
+            )
+            if area is not None:
+                return area
+        return ""
+
     def process_chunk(self, chunk):
         chunk["original_delivery_address"] = chunk["delivery_address"]
 
@@ -91,7 +230,7 @@ class RegexProcessingPipeline:
         )
 
         chunk["Matched Zones"] = chunk.apply(
-            lambda row: self.extract_zones(
+            lambda row: self.extract_zone_matches(
                 row["delivery_address"], row["dest_city_name"]
             ),
             axis=1,
@@ -104,29 +243,51 @@ class RegexProcessingPipeline:
 
         chunk["Count of Zones matched"] = chunk["Matched Zones"].apply(len)
         chunk["Matched Terms"] = chunk["Matched Zones"].apply(
-            lambda x: ", ".join(x.values())
+            lambda x: ", ".join(match["term"] for match in x.values())
         )
 
-        chunk["L3_L4"] = chunk.apply(
-            lambda row: (
-                next(iter(row["Matched Zones"].keys())).split(" - ", 1)[1]
-                if row["Count of Zones matched"] == 1
-                else ""
+        # Unambiguous matches feed the per-city priors used to break ties
+        unambiguous = chunk[chunk["Count of Zones matched"] == 1]
+        self.resolver.learn_priors(
+            unambiguous["id"],
+            unambiguous["dest_city_name"],
+            unambiguous["Matched Zones"].apply(
+                lambda x: next(iter(x)).split(" - ", 1)[1]
             ),
-            axis=1,
         )
 
+        chunk["Zone Key"] = chunk.apply(self.resolve_zone, axis=1)
+        chunk["L3_L4"] = chunk["Zone Key"].apply(
+            lambda key: key.split(" - ", 1)[1] if key else ""
+        )
+
+        # Regex-resolved rows carry their ids from the precompiled table, so
+        # the mapping stage can skip its string lookups for them
+        resolved = chunk["Zone Key"] != ""
+        mapped = pd.DataFrame(
+            [
+                self.resolution_table.lookup(key)
+                for key in chunk.loc[resolved, "Zone Key"]
+            ],
+            index=chunk.index[resolved],
+            columns=schema.MAPPED_COLUMNS,
+        )
+        for column in schema.MAPPED_COLUMNS:
+            chunk[column] = mapped[column].reindex(chunk.index)
+        chunk["Mapping_Source"] = resolved.map({True: "regex", False: None})
+
         chunk["delivery_address"] = chunk["original_delivery_address"]
         chunk = chunk.drop(
             columns=[
                 "Matched Zones",
                 "Count of Zones matched",
                 "Matched Terms",
+                "Zone Key",
                 "original_delivery_address",
             ]
         )
 
-        return chunk
+        return schema.apply_schema(chunk)
 
     def test_address(self, address, city):
         self.logger.setLevel(logging.DEBUG)
@@ -139,7 +300,7 @@ class RegexProcessingPipeline:
 
     def process_data(self):
         try:
-            df = pd.read_csv(self.input_file)
+            df = schema.read_csv(self.input_file)
             processed_df = self.process_chunk(df)
             return processed_df
         except Exception as e:
@@ -164,6 +325,8 @@ class RegexProcessingPipeline:
             df = self.process_data()
             if df is not None:
                 self.save_data(df)
+                self.resolver.save_priors()
+                self.resolver.save_decisions()
                 self.logger.info("Regex processing completed successfully")
             else:
                 self.logger.error("Regex processing failed")
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from pipeline import warehouse_mapping
+from pipeline.schema import MAPPED_COLUMNS
+from pipeline.warehouse_mapping import WarehouseMappingPipeline
+
+
+class ResolutionTable:
+    """Precomputed ``"City - Area"`` hierarchy key -> L3/L4/warehouse ids.
+
+    Hierarchy areas are named like the mapping file's ``L3_Area`` column
+    ("Karachi - Gulshan-e-Iqbal"), so each key is linked to the row with that
+    ``L3_Area`` in the same city; keys without one fall back to the mapping
+    stage's own lookup cascade. Rows matched by the regex stage then carry
+    their ids straight through instead of being string-matched against L3
+    Mapping.csv per order. The table is cached and rebuilt whenever the
+    hierarchy, the mapping file, the direct-mapping city list or the lookup
+    cascade's code changes.
+    """
+
+    def __init__(self):
+        self.table_file = Path("artifacts/resolution_table/resolution_table.json")
+        self.coverage_file = Path("artifacts/resolution_table/unmapped_areas.csv")
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        self.logger = logging.getLogger(__name__)
+
+        self.table_file.parent.mkdir(parents=True, exist_ok=True)
+
+        self.mapper = WarehouseMappingPipeline()
+        self.table = {}
+
+    def source_signature(self, zones_file):
+        digest = hashlib.md5()
+        # The mapping module's source stands in for the cascade and this
+        # module's for the direct link, so a change to either set of rules
+        # invalidates the cache as well as a data change
+        for path in (
+            zones_file,
+            self.mapper.mapping_file,
+            warehouse_mapping.__file__,
+            __file__,
+        ):
+            digest.update(Path(path).read_bytes())
+        digest.update(json.dumps(self.mapper.direct_mapping_cities).encode())
+        return digest.hexdigest()
+
+    def json_value(self, value):
+        if pd.isna(value):
+            return None
+        if hasattr(value, "item"):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    def normalize_area(self, area):
+        if pd.isna(area):
+            return ""
+        return " ".join(str(area).lower().split())
+
+    def l3_area_rows(self, mapping_df):
+        # First mapping row per (city, L3_Area), the row the cascade would pick
+        rows = {}
+        for _, row in mapping_df.iterrows():
+            key = (
+                self.mapper.normalize_city_name(row["dest_city_name"]),
+                self.normalize_area(row["L3_Area"]),
+            )
+            rows.setdefault(key, row)
+        return rows
+
+    def build(self, city_hierarchy):
+        """Return the table keyed by ``"City - Area"`` and the ``(city, area)``
+        pairs that could not be linked to any mapping row."""
+        mapping_df = self.mapper.load_mapping()
+        l3_rows = self.l3_area_rows(mapping_df)
+        table = {}
+        unmapped = []
+        for city, areas in city_hierarchy.items():
+            normalized_city = self.mapper.normalize_city_name(city)
+            for area in areas:
+                row = l3_rows.get((normalized_city, self.normalize_area(area)))
+                if row is not None:
+                    mapped = pd.Series(
+                        {
+                            "Mapped_L4_Id": row["L4_Id"],
+                            "Mapped_Warehouse_Title": row["Correct Warehouse Title"],
+                            "mapped_warehouse_id": row["warehouse_id"],
+                            "mapped_l3_id": row["L3_Id"],
+                        }
+                    )
+                else:
+                    mapped = self.mapper.map_warehouse(
+                        pd.Series({"L3_L4": area, "dest_city_name": city}), mapping_df
+                    )
+                table[f"{city} - {area}"] = {
+                    column: self.json_value(mapped[column])
+                    for column in MAPPED_COLUMNS
+                }
+                if table[f"{city} - {area}"]["mapped_l3_id"] is None:
+                    unmapped.append((city, area))
+        return table, unmapped
+
+    def load(self, city_hierarchy, zones_file):
+        signature = self.source_signature(zones_file)
+        if self.table_file.exists():
+            try:
+                with open(self.table_file, "r") as f:
+                    cached = json.load(f)
+                if cached.get("signature") == signature:
+                    self.table = cached["table"]
+                    return self.table
+            except Exception as e:
+                self.logger.warning(f"Ignoring unreadable resolution table: {e}")
+
+        self.logger.info("Building regex-to-warehouse resolution table")
+        self.table, unmapped = self.build(city_hierarchy)
+        with open(self.table_file, "w") as f:
+            json.dump({"signature": signature, "table": self.table}, f)
+        self.save_coverage_report(unmapped)
+        return self.table
+
+    def save_coverage_report(self, unmapped):
+        pd.DataFrame(unmapped, columns=["city", "area"]).to_csv(
+            self.coverage_file, index=False
+        )
+        self.logger.info(
+            f"{len(unmapped)} of {len(self.table)} hierarchy areas have no mapping "
+            f"row; see {self.coverage_file}"
+        )
+
+    def lookup(self, key):
+        return self.table.get(key, dict.fromkeys(MAPPED_COLUMNS))
@@ -0,0 +1,78 @@
+import pandas as pd
+
+# Columns the warehouse mapping stage adds, in the order it adds them
+MAPPED_COLUMNS = [
+    "Mapped_L4_Id",
+    "Mapped_Warehouse_Title",
+    "mapped_warehouse_id",
+    "mapped_l3_id",
+]
+
+# Low-cardinality strings repeated across every order
+CATEGORY_COLUMNS = [
+    "origin_city_name",
+    "dest_city_name",
+    "warehouse_title",
+    "area_title",
+    "sort_addr_title",
+    "warehouse_title_old",
+    "area_title_old",
+    "sort_addr_title_old",
+    "L3_L4",
+    "Mapped_Warehouse_Title",
+    "Geocode_Confidence",
+    "Mapping_Source",
+    # L3 Mapping.csv
+    "Mapping",
+    "L3_Area",
+    "L4_Zone",
+    "Correct Warehouse Title",
+]
+
+# Nullable integers, so a missing id no longer turns the column into float64
+ID_COLUMNS = {
+    "id": "Int64",
+    "origin_city_id": "Int32",
+    "city_id": "Int32",
+    "warehouse_id": "Int32",
+    "area_id": "Int32",
+    "sort_addr_id": "Int32",
+    "warehouse_id_old": "Int32",
+    "area_id_old": "Int32",
+    "sort_addr_id_old": "Int32",
+    "sorted_flag": "Int8",
+    "mapped_l3_id": "Int32",
+    "mapped_warehouse_id": "Int32",
+    "Mapped_L4_Id": "Int32",
+    # L3 Mapping.csv
+    "City_Id": "Int32",
+    "L3_Id": "Int32",
+    "L4_Id": "Int32",
+}
+
+
+def apply_schema(df):
+    """Convert the known columns of ``df`` in place to their compact dtypes
+    and return it."""
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(
+            df[column].dtype, pd.CategoricalDtype
+        ):
+            df[column] = df[column].astype("category")
+
+    for column, dtype in ID_COLUMNS.items():
+        if column in df.columns and df[column].dtype != dtype:
+            df[column] = pd.to_numeric(df[column]).astype(dtype)
+
+    return df
+
+
+def read_csv(path, **kwargs):
+    """``pd.read_csv`` that parses the repeated strings straight into
+    categoricals and the ids into nullable integers."""
+    dtype = {column: "category" for column in CATEGORY_COLUMNS}
+    dtype.update(kwargs.pop("dtype", {}))
+    reader = pd.read_csv(path, dtype=dtype, **kwargs)
+    if kwargs.get("chunksize"):
+        return (apply_schema(chunk) for chunk in reader)
+    return apply_schema(reader)
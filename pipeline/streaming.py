@@ -0,0 +1,165 @@
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+
+# Marks the end of the batch stream on a stage's input queue
+_END = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, output_file=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.output_file = Path(output_file) if output_file else None
+
+
+class CsvAppender:
+    """Appends batches to a CSV artifact from several threads, writing the
+    header only once."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.header_written = False
+
+    def append(self, df):
+        with self.lock:
+            df.to_csv(
+                self.path,
+                mode="a" if self.header_written else "w",
+                header=not self.header_written,
+                index=False,
+            )
+            self.header_written = True
+
+
+class StreamingExecutor:
+    """Runs a chain of stages over a stream of DataFrame batches.
+
+    Every stage has its own pool of worker threads reading from a bounded
+    queue, so a slow stage blocks its producer instead of letting batches pile
+    up in memory, and network-bound and DB-bound stages overlap with the rest.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        self.logger = logging.getLogger(__name__)
+
+    def _put(self, q, item):
+        # Retry so a failure elsewhere can unblock a producer stuck on a full queue
+        while not self.failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.failed.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            batch = self._get(inbox)
+            if batch is _END:
+                break
+            try:
+                started = time.perf_counter()
+                result = stage.func(batch)
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                self.logger.error(f"Stage {stage.name} failed: {e}")
+                self.logger.exception(e)
+                with self.lock:
+                    self.errors.append(e)
+                self.failed.set()
+                break
+
+            with self.lock:
+                self.busy[stage.name] += elapsed
+                self.rows[stage.name] += len(result)
+                if outbox is None and self.first_output is None:
+                    self.first_output = time.perf_counter() - self.started
+
+            if stage.name in self.appenders:
+                self.appenders[stage.name].append(result)
+            if outbox is not None and not self._put(outbox, result):
+                break
+
+        # The last worker of a stage to finish closes the next stage's queue
+        with self.lock:
+            self.active[index] -= 1
+            last = self.active[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                self._put(outbox, _END)
+
+    def run(self, batches):
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.appenders = {
+            stage.name: CsvAppender(stage.output_file)
+            for stage in self.stages
+            if stage.output_file is not None
+        }
+        self.lock = threading.Lock()
+        self.failed = threading.Event()
+        self.errors = []
+        self.active = [stage.workers for stage in self.stages]
+        self.busy = {stage.name: 0.0 for stage in self.stages}
+        self.rows = {stage.name: 0 for stage in self.stages}
+        self.first_output = None
+        self.started = time.perf_counter()
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index,),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        for batch in batches:
+            if not self._put(self.queues[0], batch):
+                break
+        for _ in range(self.stages[0].workers):
+            self._put(self.queues[0], _END)
+
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        total = time.perf_counter() - self.started
+        for stage in self.stages:
+            self.logger.info(
+                f"{stage.name}: {self.rows[stage.name]} rows, "
+                f"{self.busy[stage.name]:.1f}s busy across {stage.workers} worker(s)"
+            )
+        if self.first_output is not None:
+            self.logger.info(f"First batch completed after {self.first_output:.1f}s")
+        self.logger.info(f"Streaming run finished in {total:.1f}s")
+        return self.rows
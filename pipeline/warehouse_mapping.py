@@ -1,5 +1,6 @@
 import pandas as pd
 from pathlib import Path
+from pipeline import schema
 
 
 class WarehouseMappingPipeline:
@@ -76,16 +77,16 @@ class WarehouseMappingPipeline:
         try:
             # Attempting to load the data using 'utf-8' encoding
             print("Attempting to load data using 'utf-8' encoding...")
-            data_df = pd.read_csv(self.input_file)
-            mapping_df = pd.read_csv(self.mapping_file)
+            data_df = schema.read_csv(self.input_file)
+            mapping_df = schema.read_csv(self.mapping_file)
             return data_df, mapping_df
         except UnicodeDecodeError as e:
             print(f"UnicodeDecodeError encountered: {e}")
             print("Retrying to load data with 'ISO-8859-1' encoding...")
             try:
                 # Retry loading the data using 'ISO-8859-1' encoding
-                data_df = pd.read_csv(self.input_file, encoding="ISO-8859-1")
-                mapping_df = pd.read_csv(self.mapping_file, encoding="ISO-8859-1")
+                data_df = schema.read_csv(self.input_file, encoding="ISO-8859-1")
+                mapping_df = schema.read_csv(self.mapping_file, encoding="ISO-8859-1")
                 return data_df, mapping_df
             except Exception as e:
                 print(f"Error loading data after retry: {e}")
@@ -94,6 +95,12 @@ class WarehouseMappingPipeline:
             print(f"Unexpected error loading data: {e}")
             return None, None
 
+    def load_mapping(self):
+        try:
+            return schema.read_csv(self.mapping_file)
+        except UnicodeDecodeError:
+            return schema.read_csv(self.mapping_file, encoding="ISO-8859-1")
+
     def normalize_city_name(self, city_name):
         if pd.isna(city_name):
             return ""
@@ -214,15 +221,32 @@ class WarehouseMappingPipeline:
         )
 
     def process_data(self, data_df, mapping_df):
-        # Apply the mapping function row by row
-        mapped_columns = data_df.apply(
-            self.map_warehouse, axis=1, mapping_df=mapping_df
-        )
+        # Rows the regex stage resolved already carry their ids
+        if "Mapping_Source" in data_df.columns:
+            pending = data_df[data_df["Mapping_Source"] != "regex"]
+        else:
+            pending = data_df
 
-        # Concatenate the original data with the new mapped columns
-        result_df = pd.concat([data_df, mapped_columns], axis=1)
+        result_df = data_df.copy()
+        for column in schema.MAPPED_COLUMNS + ["Mapping_Source"]:
+            if column not in result_df.columns:
+                result_df[column] = None
+            result_df[column] = result_df[column].astype(object)
 
-        return result_df
+        if not pending.empty:
+            # Apply the mapping function row by row
+            mapped_columns = pending.apply(
+                self.map_warehouse, axis=1, mapping_df=mapping_df
+            )
+            for column in schema.MAPPED_COLUMNS:
+                result_df.loc[pending.index, column] = mapped_columns[column]
+            result_df.loc[pending.index, "Mapping_Source"] = "lookup"
+
+        print(
+            f"{len(data_df) - len(pending)} rows mapped by the regex stage, "
+            f"{len(pending)} looked up"
+        )
+        return schema.apply_schema(result_df)
 
     def save_data(self, df):
         df.to_csv(self.output_file, index=False)
@@ -0,0 +1,193 @@
+import json
+import logging
+import math
+import os
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+
+class ZoneResolver:
+    """Scores competing area matches so ambiguous addresses can be resolved
+    locally instead of being sent to the geocoding API.
+
+    Each candidate is a dict with the matched ``term``, its ``start`` offset in
+    the preprocessed address and whether the alternative that matched was a
+    hand-written ``regex`` rather than a literal locality name.
+    """
+
+    def __init__(self):
+        # Kept outside the regex stage's DVC outs so it survives dvc repro
+        self.priors_file = Path("artifacts/area_priors/area_priors.json")
+        self.decisions_file = Path(
+            "artifacts/regex_processing/disambiguation_decisions.csv"
+        )
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        self.logger = logging.getLogger(__name__)
+
+        # Relative weight of each signal in the candidate score
+        self.weights = {
+            "length": 0.35,
+            "position": 0.15,
+            "specificity": 0.15,
+            "prior": 0.35,
+        }
+        # Scores are turned into probabilities with a softmax at this
+        # temperature; the winner needs min_confidence and a lead of min_margin
+        # over the runner-up before a row is resolved locally
+        self.temperature = 0.1
+        self.min_confidence = 0.7
+        self.min_margin = 0.4
+
+        # Ingestion only pulls the current day's bookings, so ids counted on an
+        # earlier day can never come back and only today's are remembered
+        self.counted_date = date.today().isoformat()
+        self.priors, self.counted_ids = self.load_priors()
+        self.decisions = []
+
+    def load_priors(self):
+        if not self.priors_file.exists():
+            return {}, set()
+        try:
+            with open(self.priors_file, "r") as f:
+                state = json.load(f)
+            if state.get("counted_date") != self.counted_date:
+                return state["counts"], set()
+            return state["counts"], set(state["counted_ids"])
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable priors file: {e}")
+            return {}, set()
+
+    def save_priors(self):
+        self.priors_file.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "counts": self.priors,
+            "counted_date": self.counted_date,
+            "counted_ids": sorted(self.counted_ids),
+        }
+        # Write to a temp file and rename over the priors, so a crash mid-write
+        # never leaves a truncated file that would reset them
+        fd, tmp_path = tempfile.mkstemp(dir=self.priors_file.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.priors_file)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self.logger.info(f"Area priors saved to {self.priors_file}")
+
+    def learn_priors(self, ids, cities, areas):
+        """Accumulate per-city area counts from rows that were resolved
+        without ambiguity. Each of the day's order ids is counted once, so
+        re-running the same day's orders does not inflate the counts."""
+        for row_id, city, area in zip(ids, cities, areas):
+            if pd.isna(row_id) or pd.isna(city) or pd.isna(area) or area == "":
+                continue
+            row_id = int(row_id)
+            if row_id in self.counted_ids:
+                continue
+            self.counted_ids.add(row_id)
+            city_counts = self.priors.setdefault(str(city), {})
+            city_counts[area] = city_counts.get(area, 0) + 1
+
+    def prior_share(self, city, area):
+        city_counts = self.priors.get(str(city), {})
+        total = sum(city_counts.values())
+        if total == 0:
+            return 0.0
+        return city_counts.get(area, 0) / total
+
+    def score_candidates(self, address, city, candidates):
+        longest = max(len(c["term"]) for c in candidates.values()) or 1
+        span = max(len(address), 1)
+        # Without any history for the city every candidate gets an even prior
+        has_priors = bool(self.priors.get(str(city)))
+
+        scores = {}
+        for area, candidate in candidates.items():
+            signals = {
+                "length": len(candidate["term"]) / longest,
+                # Addresses run from house number towards the city, so matches
+                # further right tend to name the area rather than a street
+                "position": candidate["start"] / span,
+                "specificity": 1.0 if candidate["regex"] else 0.5,
+                "prior": (
+                    self.prior_share(city, area.split(" - ", 1)[1])
+                    if has_priors
+                    else 1.0 / len(candidates)
+                ),
+            }
+            scores[area] = sum(self.weights[k] * v for k, v in signals.items())
+        return scores
+
+    def resolve(self, row_id, address, city, candidates):
+        """Return the winning ``"City - Area"`` key, or ``None`` when the
+        candidates are too close to call."""
+        scores = self.score_candidates(address, city, candidates)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        top = ranked[0][1]
+        weights = [math.exp((score - top) / self.temperature) for _, score in ranked]
+        total = sum(weights)
+
+        best_area = ranked[0][0]
+        confidence = weights[0] / total
+        runner_up = weights[1] / total if len(weights) > 1 else 0.0
+        resolved = (
+            confidence >= self.min_confidence
+            and confidence - runner_up >= self.min_margin
+        )
+
+        self.decisions.append(
+            {
+                "id": row_id,
+                "dest_city_name": city,
+                "candidates": json.dumps(
+                    {area: round(score, 4) for area, score in ranked}
+                ),
+                "chosen": best_area.split(" - ", 1)[1] if resolved else "",
+                "confidence": round(confidence, 4),
+                "resolved": resolved,
+            }
+        )
+        return best_area if resolved else None
+
+    def save_decisions(self):
+        if not self.decisions:
+            return
+        self.decisions_file.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame(self.decisions).to_csv(self.decisions_file, index=False)
+        resolved = sum(d["resolved"] for d in self.decisions)
+        self.logger.info(
+            f"Resolved {resolved} of {len(self.decisions)} ambiguous rows locally; "
+            f"decisions saved to {self.decisions_file}"
+        )
+
+    def evaluate_decisions(self, reference_df, label_column="area_title"):
+        """Compare logged decisions against a reference frame (for example a
+        later export of sorted orders) and return the accuracy of the rows
+        that were resolved locally."""
+        decisions = pd.read_csv(self.decisions_file)
+        decisions = decisions[decisions["resolved"]]
+        merged = decisions.merge(
+            reference_df[["id", label_column]].dropna(), on="id", how="inner"
+        )
+        if merged.empty:
+            self.logger.info("No labelled rows available to evaluate decisions")
+            return None
+
+        expected = merged[label_column].astype(str).str.strip().str.lower()
+        chosen = merged["chosen"].astype(str).str.strip().str.lower()
+        accuracy = (expected == chosen).mean()
+        self.logger.info(
+            f"Disambiguation accuracy: {accuracy:.2%} over {len(merged)} rows"
+        )
+        return accuracy